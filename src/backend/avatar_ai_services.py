@@ -5,22 +5,34 @@ import httpx
 import openai
 import base64
 import json
+import orjson
 import os
-from typing import Optional, Dict, Any
-import tempfile
+import time
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable, List, Tuple, Union
 import wave
 import io
 from datetime import datetime
 import logging
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import BlobServiceClient, ContentSettings
 from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
 import redis.asyncio as redis
 import hashlib
+import re
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sentence boundary used to pipeline streamed LLM output into TTS
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Usage stats of short replies and registry of their pre-rendered videos (see canned_avatar_job.py)
+CANNED_STATS_KEY = "stats:canned_replies"
+CANNED_REGISTRY_KEY = "canned_avatars"
+
+# Base64 payloads above this size are encoded/decoded in a thread to keep the loop responsive
+B64_THREAD_THRESHOLD = 65536
+
 class AzureStorageService:
     """Azure Blob Storage service for caching and content delivery"""
     
@@ -34,7 +46,11 @@ class AzureStorageService:
             try:
                 self.blob_service = AsyncBlobServiceClient(
                     account_url=f"https://{self.account_name}.blob.core.windows.net",
-                    credential=self.account_key
+                    credential=self.account_key,
+                    # Anything over 1MB goes up as parallel 1MB blocks - a single PUT reads the whole
+                    # body into memory first, so it must not be larger than one block
+                    max_single_put_size=1024 * 1024,
+                    max_block_size=1024 * 1024
                 )
                 logger.info("Azure Storage service initialized successfully")
             except Exception as e:
@@ -44,14 +60,50 @@ class AzureStorageService:
             logger.warning("Azure Storage credentials not configured")
             self.blob_service = None
     
-    async def upload_avatar_video(self, video_data: bytes, user_id: str, video_id: str) -> str:
-        """Upload avatar video to blob storage and return CDN URL"""
+    async def upload_avatar_video(self, video_data: Union[bytes, AsyncIterator[bytes]], user_id: str, video_id: str, length: Optional[int] = None) -> str:
+        """Upload avatar video (bytes or async chunk stream) to blob storage and return CDN URL"""
+        return await self._upload_video(video_data, f"avatars/{user_id}/{video_id}.mp4", length)
+    
+    async def upload_canned_avatar(self, video_data: Union[bytes, AsyncIterator[bytes]], cache_key: str, length: Optional[int] = None) -> str:
+        """Upload a pre-rendered avatar video for a canned reply and return CDN URL"""
+        return await self._upload_video(video_data, f"avatars/canned/{cache_key}.mp4", length)
+    
+    async def get_canned_avatar_url(self, cache_key: str) -> Optional[str]:
+        """Return CDN URL of a pre-rendered avatar video, None if not rendered yet"""
+        try:
+            if not self.blob_service:
+                return None
+            
+            blob_client = self.blob_service.get_blob_client(
+                container="avatar-videos", 
+                blob=f"avatars/canned/{cache_key}.mp4"
+            )
+            
+            if await blob_client.exists():
+                return self.canned_avatar_url(cache_key)
+            return None
+            
+        except Exception as e:
+            logger.warning(f"Error looking up canned avatar: {str(e)}")
+            return None
+    
+    def canned_avatar_url(self, cache_key: str) -> str:
+        """CDN URL of a pre-rendered avatar video (without checking that it exists)"""
+        return self._public_url("avatar-videos", f"avatars/canned/{cache_key}.mp4")
+    
+    def _public_url(self, container: str, blob_name: str) -> str:
+        """Return CDN URL if available, otherwise blob URL"""
+        if self.cdn_endpoint:
+            return f"{self.cdn_endpoint}/{container}/{blob_name}"
+        else:
+            return f"https://{self.account_name}.blob.core.windows.net/{container}/{blob_name}"
+    
+    async def _upload_video(self, video_data: Union[bytes, AsyncIterator[bytes]], blob_name: str, length: Optional[int] = None) -> str:
+        """Upload video to the avatar-videos container and return CDN URL"""
         try:
             if not self.blob_service:
                 raise Exception("Azure Storage not configured")
                 
-            blob_name = f"avatars/{user_id}/{video_id}.mp4"
-            
             # Upload to blob storage
             blob_client = self.blob_service.get_blob_client(
                 container="avatar-videos", 
@@ -60,15 +112,13 @@ class AzureStorageService:
             
             await blob_client.upload_blob(
                 video_data, 
+                length=length,
                 overwrite=True,
-                content_settings={"content_type": "video/mp4"}
+                max_concurrency=4,
+                content_settings=ContentSettings(content_type="video/mp4")
             )
             
-            # Return CDN URL if available, otherwise blob URL
-            if self.cdn_endpoint:
-                return f"{self.cdn_endpoint}/avatar-videos/{blob_name}"
-            else:
-                return f"https://{self.account_name}.blob.core.windows.net/avatar-videos/{blob_name}"
+            return self._public_url("avatar-videos", blob_name)
                 
         except Exception as e:
             logger.error(f"Error uploading avatar video: {str(e)}")
@@ -89,7 +139,7 @@ class AzureStorageService:
             await blob_client.upload_blob(
                 audio_data, 
                 overwrite=True,
-                content_settings={"content_type": "audio/wav"}
+                content_settings=ContentSettings(content_type="audio/wav")
             )
             
             return blob_name
@@ -104,6 +154,14 @@ class RedisQueueService:
     def __init__(self):
         self.redis_url = os.getenv("REDIS_URL")
         self.redis_client = None
+        self.dedupe_ttl = int(os.getenv("TASK_DEDUPE_TTL", 60))
+        self.task_ttl = 3600
+        
+        # Redis stream consumed by avatar workers (see avatar_worker.py)
+        self.stream = "avatar_queue"
+        self.group = "workers"
+        self.stream_maxlen = 10000
+        self._group_ready = False
         
     async def connect(self):
         """Connect to Redis"""
@@ -127,13 +185,32 @@ class RedisQueueService:
             if not self.redis_client:
                 raise Exception("Redis not available")
                 
-            task_id = f"task_{datetime.now().timestamp()}_{hash(str(task_data))}"
+            # Deterministic digest over canonical JSON - identical payloads match across workers
+            canonical = orjson.dumps(task_data, option=orjson.OPT_SORT_KEYS)
+            digest = hashlib.blake2b(canonical, digest_size=12).hexdigest()
+            task_id = f"task_{time.time_ns()}_{digest}"
+            
+            # Collapse duplicate submissions of the same payload onto the first task
+            if not await self.redis_client.set(f"task_dedupe:{digest}", task_id, nx=True, ex=self.dedupe_ttl):
+                existing_task_id = await self.redis_client.get(f"task_dedupe:{digest}")
+                if existing_task_id:
+                    logger.info(f"Duplicate task, reusing {existing_task_id}")
+                    return existing_task_id
+            
             task_data["task_id"] = task_id
+            task_data["dedupe_digest"] = digest  # lets the worker release the key if the task fails
             
-            await self.redis_client.lpush(
-                "avatar_processing_queue", 
-                json.dumps(task_data)
-            )
+            # Enqueue and record task status in a single round-trip
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.xadd(self.stream, {"payload": orjson.dumps(task_data)}, maxlen=self.stream_maxlen, approximate=True)
+                    pipe.hset(f"task:{task_id}", mapping={"status": "queued", "ts": time.time()})
+                    pipe.expire(f"task:{task_id}", self.task_ttl)
+                    await pipe.execute()
+            except Exception:
+                # Never enqueued - don't hand this task_id to identical retries
+                await self.release_dedupe(digest, task_id)
+                raise
             
             logger.info(f"Task {task_id} added to processing queue")
             return task_id
@@ -142,6 +219,16 @@ class RedisQueueService:
             logger.error(f"Error adding task to queue: {str(e)}")
             raise
     
+    async def release_dedupe(self, digest: str, task_id: str):
+        """Drop the dedupe entry of a task that will not succeed, unless it already points to a newer task"""
+        try:
+            if not self.redis_client:
+                await self.connect()
+            if self.redis_client and await self.redis_client.get(f"task_dedupe:{digest}") == task_id:
+                await self.redis_client.delete(f"task_dedupe:{digest}")
+        except Exception as e:
+            logger.warning(f"Failed to release dedupe key for {task_id}: {str(e)}")
+    
     async def get_task_result(self, task_id: str, timeout: int = 60) -> dict:
         """Wait for task result"""
         try:
@@ -152,48 +239,367 @@ class RedisQueueService:
                 raise Exception("Redis not available")
                 
             result_key = f"task_result:{task_id}"
+            deadline = time.monotonic() + max(timeout, 1)
             
-            # Wait for result with timeout
-            for i in range(timeout):
-                result = await self.redis_client.get(result_key)
+            while True:
+                # Result already delivered to another waiter of a deduplicated task
+                payload = await self.redis_client.hget(f"task:{task_id}", "result")
+                if payload:
+                    return orjson.loads(payload)
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                
+                # Block until the worker pushes the result (BLPOP pops it, no clean up needed)
+                result = await self.redis_client.blpop(result_key, timeout=max(min(remaining, 5), 1))
                 if result:
-                    await self.redis_client.delete(result_key)  # Clean up
-                    return json.loads(result)
-                await asyncio.sleep(1)
+                    _, payload = result
+                    return orjson.loads(payload)
                 
             raise Exception("Task timeout")
             
         except Exception as e:
             logger.error(f"Error getting task result: {str(e)}")
             raise
+    
+    async def set_task_result(self, task_id: str, result: dict, ttl: int = 3600):
+        """Publish task result, waking any waiter blocked in get_task_result"""
+        try:
+            if not self.redis_client:
+                await self.connect()
+                
+            if not self.redis_client:
+                raise Exception("Redis not available")
+                
+            result_key = f"task_result:{task_id}"
+            
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lpush(result_key, orjson.dumps(result))
+                pipe.expire(result_key, ttl)
+                pipe.hset(f"task:{task_id}", mapping={"status": "failed" if result.get("status") == "failed" else "completed", "result": orjson.dumps(result)})
+                pipe.expire(f"task:{task_id}", ttl)
+                await pipe.execute()
+            
+            logger.info(f"Result for task {task_id} published")
+            
+        except Exception as e:
+            logger.error(f"Error setting task result: {str(e)}")
+            raise
+    
+    async def get_task_status(self, task_id: str) -> Optional[dict]:
+        """Current status of a task (with its result once finished) without waiting - None if unknown or expired"""
+        try:
+            if not self.redis_client:
+                await self.connect()
+                
+            if not self.redis_client:
+                raise Exception("Redis not available")
+            
+            task = await self.redis_client.hgetall(f"task:{task_id}")
+            if not task:
+                return None
+            
+            return {
+                "task_id": task_id,
+                "status": task.get("status"),
+                "result": orjson.loads(task["result"]) if task.get("result") else None
+            }
+            
+        except Exception as e:
+            logger.error(f"Error getting task status: {str(e)}")
+            raise
+    
+    async def expect_talk(self, talk_id: str, ttl: int = 600):
+        """Record a D-ID talk created by this service so its webhook is accepted"""
+        if not self.redis_client:
+            await self.connect()
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        await self.redis_client.set(f"did_pending:{talk_id}", 1, ex=ttl)
+    
+    async def deliver_talk_result(self, talk_id: str, result: dict, ttl: int = 600) -> bool:
+        """Hand a webhook payload to the waiter of a pending talk - False for unknown or finished talks"""
+        if not self.redis_client:
+            await self.connect()
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        
+        # Deleting the pending marker accepts exactly one completion per talk
+        if not await self.redis_client.delete(f"did_pending:{talk_id}"):
+            return False
+        
+        result_key = f"did_result:{talk_id}"
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.lpush(result_key, orjson.dumps(result))
+            pipe.expire(result_key, ttl)
+            await pipe.execute()
+        return True
+    
+    async def wait_talk_result(self, talk_id: str, timeout: float) -> Optional[dict]:
+        """Block up to timeout seconds for a webhook-delivered talk result"""
+        if not self.redis_client:
+            await self.connect()
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        
+        result = await self.redis_client.blpop(f"did_result:{talk_id}", timeout=timeout)
+        if result:
+            _, payload = result
+            return orjson.loads(payload)
+        return None
+    
+    async def read_tasks(self, consumer: str, count: int = 8, block_ms: int = 30000, pending: bool = False) -> List[Tuple[str, dict]]:
+        """Block on the avatar stream for new tasks (or this consumer's unacknowledged ones)"""
+        if not self.redis_client:
+            await self.connect()
+            
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        
+        if not self._group_ready:
+            try:
+                await self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self._group_ready = True
+        
+        response = await self.redis_client.xreadgroup(
+            self.group, consumer, {self.stream: "0" if pending else ">"},
+            count=count, block=None if pending else block_ms
+        )
+        
+        entries = [entry for _, stream_entries in response for entry in stream_entries]
+        return await self._parse_entries(entries)
+    
+    async def claim_stale_tasks(self, consumer: str, min_idle_ms: int, count: int = 8) -> List[Tuple[str, dict]]:
+        """Take over entries left unacknowledged by other consumers (e.g. a restarted pod with a new name)"""
+        if not self.redis_client:
+            await self.connect()
+            
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        
+        # XPENDING + XCLAIM rather than XAUTOCLAIM / XPENDING IDLE, which need Redis 6.2
+        pending = await self.redis_client.xpending_range(self.stream, self.group, min="-", max="+", count=count * 16)
+        stale_ids = [entry["message_id"] for entry in pending if entry["time_since_delivered"] >= min_idle_ms][:count]
+        if not stale_ids:
+            return []
+        
+        # min_idle_time makes XCLAIM skip entries another consumer claimed meanwhile
+        response = await self.redis_client.xclaim(
+            self.stream, self.group, consumer, min_idle_time=min_idle_ms, message_ids=stale_ids
+        )
+        return await self._parse_entries([entry for entry in response if entry and entry[0] is not None])
+    
+    async def _parse_entries(self, entries: list) -> List[Tuple[str, dict]]:
+        """Decode stream entries into (entry_id, task_data) pairs"""
+        tasks = []
+        for entry_id, fields in entries:
+            if fields:
+                tasks.append((entry_id, orjson.loads(fields["payload"])))
+            else:
+                # Pending entry already trimmed from the stream
+                await self.ack_task(entry_id)
+        return tasks
+    
+    async def ack_task(self, entry_id: str):
+        """Acknowledge a processed stream entry and delete it (entries carry the full audio payload)"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+class RedisCacheService:
+    """Redis cache for reusing LLM, TTS and avatar results across identical inputs"""
+    
+    def __init__(self):
+        self.redis_url = os.getenv("REDIS_URL")
+        self.ttl = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+        self.canned_stats_ttl = int(os.getenv("CANNED_STATS_TTL", 7 * 24 * 3600))
+        self.redis_client = None
+    
+    async def connect(self):
+        """Connect to Redis with a bytes client (cached audio is binary)"""
+        if self.redis_url and not self.redis_client:
+            try:
+                self.redis_client = redis.from_url(self.redis_url, decode_responses=False)
+                await self.redis_client.ping()
+                logger.info("Redis cache connection established successfully")
+            except Exception as e:
+                logger.error(f"Failed to connect to Redis cache: {e}")
+                self.redis_client = None
+    
+    @staticmethod
+    def make_key(prefix: str, *parts: str) -> str:
+        """Build a cache key from a hash of the given parts"""
+        digest = hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+        return f"{prefix}:{digest}"
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return cached value or None on miss (cache errors count as misses)"""
+        try:
+            if not self.redis_client:
+                await self.connect()
+            if not self.redis_client:
+                return None
+            return await self.redis_client.get(key)
+        except Exception as e:
+            logger.warning(f"Cache read failed for {key}: {str(e)}")
+            return None
+    
+    async def track_canned_reply(self, member: str, canned_key: str) -> Optional[bool]:
+        """Count a short reply for the canned pre-render job and report whether its video is rendered
+        
+        One round-trip: ZINCRBY on the usage stats (expiring, trimmed by the job) plus SISMEMBER on
+        the registry of rendered videos. Returns None when Redis is unavailable.
+        """
+        try:
+            if not self.redis_client:
+                await self.connect()
+            if not self.redis_client:
+                return None
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zincrby(CANNED_STATS_KEY, 1, member)
+                pipe.expire(CANNED_STATS_KEY, self.canned_stats_ttl)
+                pipe.sismember(CANNED_REGISTRY_KEY, canned_key)
+                _, _, rendered = await pipe.execute()
+            return bool(rendered)
+        except Exception as e:
+            logger.warning(f"Canned reply lookup failed: {str(e)}")
+            return None
+    
+    async def top_canned_replies(self, count: int) -> List[Tuple[str, float]]:
+        """Most frequent short replies as (member, count), most frequent first"""
+        if not self.redis_client:
+            await self.connect()
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        entries = await self.redis_client.zrevrange(CANNED_STATS_KEY, 0, count - 1, withscores=True)
+        return [(member.decode(), score) for member, score in entries]
+    
+    async def trim_canned_stats(self, keep: int):
+        """Drop all but the `keep` most frequent replies from the usage stats"""
+        if not self.redis_client:
+            await self.connect()
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        await self.redis_client.zremrangebyrank(CANNED_STATS_KEY, 0, -(keep + 1))
+    
+    async def is_canned_avatar_registered(self, canned_key: str) -> bool:
+        """Whether the canned video for canned_key has been rendered"""
+        if not self.redis_client:
+            await self.connect()
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        return bool(await self.redis_client.sismember(CANNED_REGISTRY_KEY, canned_key))
+    
+    async def register_canned_avatar(self, canned_key: str):
+        """Record that the canned video for canned_key exists in storage"""
+        if not self.redis_client:
+            await self.connect()
+        if not self.redis_client:
+            raise Exception("Redis not available")
+        await self.redis_client.sadd(CANNED_REGISTRY_KEY, canned_key)
+    
+    async def set(self, key: str, value: bytes, ttl: int = None):
+        """Store value in cache, ignoring cache errors"""
+        try:
+            if not self.redis_client:
+                await self.connect()
+            if not self.redis_client:
+                return
+            await self.redis_client.setex(key, ttl or self.ttl, value)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {key}: {str(e)}")
+
+class _LeaderAbandoned(Exception):
+    """The leader of an in-flight call was cancelled - followers retry instead of failing"""
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key onto one in-flight upstream call"""
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        """Return the future of an in-flight call for key, if any"""
+        return self._inflight.get(key)
+    
+    def lead(self, key: str) -> asyncio.Future:
+        """Register the caller as the one doing the work for key"""
+        future = asyncio.get_running_loop().create_future()
+        # Followers are optional - don't warn about exceptions nobody awaited
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+    
+    def settle(self, key: str, result: Any = None, error: BaseException = None):
+        """Publish the outcome to followers and clear the in-flight entry"""
+        future = self._inflight.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # Leader was cancelled/abandoned - its failure is not the followers' failure
+            future.set_exception(_LeaderAbandoned())
+    
+    async def follow(self, key: str) -> Tuple[bool, Any]:
+        """Wait for an in-flight call for key: (True, result), or (False, None) if there is none to follow
+        
+        When the leader is cancelled the entry is already cleared, so the first woken follower
+        gets (False, None) and leads the retry while the others join it.
+        """
+        while True:
+            follower = self.join(key)
+            if follower is None:
+                return False, None
+            try:
+                return True, await asyncio.shield(follower)
+            except _LeaderAbandoned:
+                continue
+    
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await call() once per key, sharing its result with concurrent callers"""
+        followed, result = await self.follow(key)
+        if followed:
+            return result
+        
+        self.lead(key)
+        try:
+            result = await call()
+        except BaseException as e:
+            self.settle(key, error=e)
+            raise
+        self.settle(key, result)
+        return result
+
+def create_openai_client() -> openai.AsyncOpenAI:
+    """Create an async OpenAI client (shared so its connection pool is reused)"""
+    openai_key = os.getenv("OPENAI_API_KEY")
+    if not openai_key:
+        raise Exception("OPENAI_API_KEY environment variable not set")
+    return openai.AsyncOpenAI(api_key=openai_key)
 
 class STTService:
     """Speech-to-Text service using OpenAI Whisper"""
     
-    def __init__(self):
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if not openai_key:
-            raise Exception("OPENAI_API_KEY environment variable not set")
-        self.client = openai.OpenAI(api_key=openai_key)
+    def __init__(self, client: Optional[openai.AsyncOpenAI] = None):
+        self.client = client or create_openai_client()
     
     async def transcribe_audio(self, audio_data: bytes, format: str = "webm") -> str:
         """Transcribe audio to text using Whisper"""
         try:
-            # Create temporary file for audio
-            with tempfile.NamedTemporaryFile(suffix=f".{format}", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-            
-            # Transcribe using Whisper
-            with open(temp_file_path, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="en"  # Can be made dynamic
-                )
-            
-            # Clean up temp file
-            os.unlink(temp_file_path)
+            # Transcribe using Whisper, uploading the in-memory bytes directly
+            transcript = await self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=(f"audio.{format}", audio_data, f"audio/{format}"),
+                language="en"  # Can be made dynamic
+            )
             
             logger.info(f"Successfully transcribed audio: {transcript.text[:50]}...")
             return transcript.text
@@ -205,12 +611,11 @@ class STTService:
 class LLMService:
     """Large Language Model service using OpenAI GPT"""
     
-    def __init__(self):
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if not openai_key:
-            raise Exception("OPENAI_API_KEY environment variable not set")
-        self.client = openai.OpenAI(api_key=openai_key)
-        self.model = "gpt-4o-mini"  # Cost-optimized model for production
+    def __init__(self, client: Optional[openai.AsyncOpenAI] = None, cache: Optional[RedisCacheService] = None):
+        self.client = client or create_openai_client()
+        self.cache = cache
+        self._inflight = SingleFlight()
+        self.model = os.getenv("LLM_MODEL", "gpt-4o-mini")  # Cost-optimized model for production
         
         # System prompt optimized for avatar conversations
         self.system_prompt = """You are a friendly, helpful AI avatar assistant. 
@@ -220,51 +625,133 @@ class LLMService:
         Avoid using markdown, bullet points, or structured text - speak naturally as if talking to someone.
         Show personality and emotion in your responses while remaining helpful and professional.
         Use contractions and casual language to sound more human and natural."""
+        
+        # Built once, shared by every request
+        self._system_message = {"role": "system", "content": self.system_prompt}
+        self.context_messages = 10  # Keep last 10 messages for context
     
-    async def generate_response(self, user_input: str, user_id: str, conversation_history: list = None) -> Dict[str, Any]:
-        """Generate AI response using GPT"""
+    async def stream_response(self, user_input: str, user_id: str, conversation_history: list = None, response_info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Stream AI response from GPT, yielding one complete sentence at a time (response_info receives the final result)"""
         try:
-            # Prepare conversation history
-            messages = [{"role": "system", "content": self.system_prompt}]
+            messages = self._build_messages(user_input, conversation_history)
             
-            if conversation_history:
-                messages.extend(conversation_history[-10:])  # Keep last 10 messages for context
+            cache_key = self._cache_key(messages)
+            cached = await self.cache.get(cache_key) if self.cache else None
+            if cached:
+                logger.info(f"LLM cache hit for user {user_id}")
             
-            messages.append({"role": "user", "content": user_input})
+            # An identical request is already streaming - wait for its full reply
+            if not cached and self._inflight.join(cache_key):
+                logger.info(f"Joining in-flight LLM request for user {user_id}")
+                followed, result = await self._inflight.follow(cache_key)
+                if followed:
+                    cached = orjson.dumps(result)
             
-            # Generate response
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=150,  # Keep responses concise for avatar
-                temperature=0.8,  # Slightly creative but consistent
-                stream=False
-            )
+            if cached:
+                result = orjson.loads(cached)
+                if response_info is not None:
+                    response_info.update(result)
+                for sentence in SENTENCE_BOUNDARY.split(result["text"]):
+                    if sentence.strip():
+                        yield sentence.strip()
+                return
+            
+            self._inflight.lead(cache_key)
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=150,  # Keep responses concise for avatar
+                    temperature=0.8,  # Slightly creative but consistent
+                    stop=["\n\n"],  # Spoken replies are a single paragraph
+                    stream=True,
+                    extra_body={"stream_options": {"include_usage": True}}  # Not a typed argument in the pinned SDK
+                )
+                
+                buffer = ""
+                streamed = []
+                tokens_used = 0
+                async for chunk in stream:
+                    # Usage arrives on a final chunk with no choices
+                    usage = getattr(chunk, "usage", None)
+                    if usage:
+                        tokens_used = usage["total_tokens"] if isinstance(usage, dict) else usage.total_tokens
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    
+                    buffer += delta
+                    
+                    # Flush every complete sentence, keep the trailing fragment buffered
+                    *sentences, buffer = SENTENCE_BOUNDARY.split(buffer)
+                    for sentence in sentences:
+                        if sentence.strip():
+                            streamed.append(sentence.strip())
+                            yield sentence.strip()
+                
+                if buffer.strip():
+                    streamed.append(buffer.strip())
+                    yield buffer.strip()
+                
+                result = {
+                    "text": " ".join(streamed),
+                    "model": self.model,
+                    "tokens_used": tokens_used,
+                    "timestamp": datetime.now().isoformat()
+                }
+            except BaseException as e:
+                self._inflight.settle(cache_key, error=e)
+                raise
             
-            ai_response = response.choices[0].message.content
+            self._inflight.settle(cache_key, result)
+            if response_info is not None:
+                response_info.update(result)
             
-            logger.info(f"Generated AI response for user {user_id}: {ai_response[:50]}...")
+            if self.cache and streamed:
+                await self.cache.set(cache_key, orjson.dumps(result))
             
-            return {
-                "text": ai_response,
-                "model": self.model,
-                "tokens_used": response.usage.total_tokens,
-                "timestamp": datetime.now().isoformat()
-            }
+            logger.info(f"Streamed AI response for user {user_id}")
             
         except Exception as e:
             logger.error(f"LLM Error: {str(e)}")
             raise Exception(f"AI response generation failed: {str(e)}")
+    
+    def _cache_key(self, messages: list) -> str:
+        """Cache key over model, system prompt, history and normalized user input"""
+        *context, user_message = messages
+        return RedisCacheService.make_key(
+            "llm",
+            self.model,
+            orjson.dumps(context, option=orjson.OPT_SORT_KEYS).decode(),
+            " ".join(user_message["content"].lower().split())
+        )
+    
+    def _build_messages(self, user_input: str, conversation_history: list = None) -> list:
+        """Prepare chat messages with system prompt and recent history"""
+        return [
+            self._system_message,
+            *(conversation_history[-self.context_messages:] if conversation_history else ()),
+            {"role": "user", "content": user_input}
+        ]
 
 class TTSService:
     """Text-to-Speech service using OpenAI TTS"""
     
-    def __init__(self):
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if not openai_key:
-            raise Exception("OPENAI_API_KEY environment variable not set")
-        self.client = openai.OpenAI(api_key=openai_key)
+    def __init__(self, client: Optional[openai.AsyncOpenAI] = None, cache: Optional[RedisCacheService] = None):
+        self.client = client or create_openai_client()
+        self.cache = cache
+        self._inflight = SingleFlight()
         self.storage_service = AzureStorageService()
+        
+        # tts-1 is much faster than tts-1-hd; the difference is lost after D-ID lip-sync
+        self.model = os.getenv("TTS_MODEL", "tts-1")
+        # mp3 keeps the payload small and, unlike opus, can be joined per sentence
+        self.response_format = os.getenv("TTS_FORMAT", "mp3")
+        if self.response_format not in ("mp3", "wav"):
+            logger.warning(f"Unsupported TTS_FORMAT {self.response_format}, using mp3")
+            self.response_format = "mp3"
     
     async def synthesize_speech(self, text: str, voice: str = "alloy", user_id: str = None) -> bytes:
         """Convert text to speech using OpenAI TTS"""
@@ -274,35 +761,109 @@ class TTSService:
             if len(clean_text) > 4000:  # OpenAI TTS limit
                 clean_text = clean_text[:4000] + "..."
             
-            response = self.client.audio.speech.create(
-                model="tts-1-hd",  # High quality model
-                voice=voice,  # alloy, echo, fable, onyx, nova, shimmer
-                input=clean_text,
-                response_format="wav"
-            )
+            cache_key = RedisCacheService.make_key(f"tts:{voice}", self.model, self.response_format, clean_text)
+            if self.cache:
+                cached = await self.cache.get(cache_key)
+                if cached:
+                    logger.info(f"TTS cache hit for text: {clean_text[:50]}...")
+                    return cached
             
-            logger.info(f"Generated TTS audio for text: {clean_text[:50]}...")
-            return response.content
+            # Identical concurrent requests share one synthesis
+            return await self._inflight.run(cache_key, lambda: self._synthesize(clean_text, voice, cache_key))
             
         except Exception as e:
             logger.error(f"TTS Error: {str(e)}")
             raise Exception(f"Speech synthesis failed: {str(e)}")
+    
+    async def _synthesize(self, clean_text: str, voice: str, cache_key: str) -> bytes:
+        """Request speech from OpenAI TTS and cache it"""
+        response = await self.client.audio.speech.create(
+            model=self.model,
+            voice=voice,  # alloy, echo, fable, onyx, nova, shimmer
+            input=clean_text,
+            response_format=self.response_format
+        )
+        
+        logger.info(f"Generated TTS audio for text: {clean_text[:50]}...")
+        
+        if self.cache:
+            await self.cache.set(cache_key, response.content)
+        
+        return response.content
+
+async def b64encode_audio(audio_data: bytes) -> str:
+    """Base64-encode audio, off the event loop for large payloads"""
+    if len(audio_data) > B64_THREAD_THRESHOLD:
+        return (await asyncio.to_thread(base64.b64encode, audio_data)).decode()
+    return base64.b64encode(audio_data).decode()
+
+async def b64decode_audio(audio_b64: str) -> bytes:
+    """Base64-decode audio, off the event loop for large payloads"""
+    if len(audio_b64) > B64_THREAD_THRESHOLD:
+        return await asyncio.to_thread(base64.b64decode, audio_b64)
+    return base64.b64decode(audio_b64)
+
+def concat_audio(chunks: List[bytes], audio_format: str = "wav") -> bytes:
+    """Join per-sentence audio clips into a single clip"""
+    if len(chunks) == 1:
+        return chunks[0]
+    
+    # MP3 frames are self-delimiting, clips can simply be appended
+    if audio_format == "mp3":
+        return b"".join(chunks)
+    
+    # WAV: keep only the first RIFF header
+    output = io.BytesIO()
+    with wave.open(output, "wb") as out:
+        for index, chunk in enumerate(chunks):
+            with wave.open(io.BytesIO(chunk), "rb") as clip:
+                if index == 0:
+                    out.setparams(clip.getparams())
+                out.writeframes(clip.readframes(clip.getnframes()))
+    
+    return output.getvalue()
 
 class DIDService:
     """D-ID service for realistic talking avatar generation with Azure integration"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[RedisCacheService] = None, queue_service: Optional[RedisQueueService] = None):
+        self.cache = cache
+        self.queue_service = queue_service
+        self._inflight = SingleFlight()
+        
+        # Webhook completion needs both the public URL and a shared secret the endpoint verifies
+        self.webhook_secret = os.getenv("DID_WEBHOOK_SECRET")
+        self.webhook_url = None
+        if os.getenv("DID_WEBHOOK_URL") and self.webhook_secret and queue_service:
+            separator = "&" if "?" in os.getenv("DID_WEBHOOK_URL") else "?"
+            self.webhook_url = f"{os.getenv('DID_WEBHOOK_URL')}{separator}token={self.webhook_secret}"
+        elif os.getenv("DID_WEBHOOK_URL"):
+            logger.warning("DID_WEBHOOK_URL set without DID_WEBHOOK_SECRET or Redis - polling D-ID instead")
+        self.canned_max_chars = int(os.getenv("CANNED_AVATAR_MAX_CHARS", 80))
+        
+        # Shared pooled HTTP/2 client - avoids a TLS handshake per D-ID call.
+        # Auth headers are passed per request since video downloads hit a different host.
+        self.base_url = "https://api.d-id.com"
+        self._keepalive_expiry = 30.0
+        self._did_response_at = 0.0  # monotonic time of the last D-ID response
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=128, keepalive_expiry=self._keepalive_expiry),
+            event_hooks={"response": [self._track_did_response]}
+        )
+        
+        self.storage_service = AzureStorageService()
+        
         self.api_key = os.getenv("DID_API_KEY")
         if not self.api_key:
             logger.warning("DID_API_KEY not set - avatar generation will be disabled")
             return
             
-        self.base_url = "https://api.d-id.com"
         self.headers = {
             "Authorization": f"Basic {self.api_key}",
             "Content-Type": "application/json"
         }
-        self.storage_service = AzureStorageService()
         
         # Default avatar configurations - production ready avatars
         self.default_avatars = {
@@ -334,137 +895,263 @@ class DIDService:
             }
         }
     
-    async def create_talking_avatar(self, audio_data: bytes, avatar_type: str = "female", user_id: str = None) -> Dict[str, Any]:
+    async def create_talking_avatar(self, audio_data: bytes, avatar_type: str = "female", user_id: str = None, audio_format: str = "wav", text: str = None, voice: str = None) -> Dict[str, Any]:
         """Create talking avatar video using D-ID with Azure storage integration"""
         try:
             if not self.api_key:
                 # Return mock response if D-ID not configured
+                now = datetime.now()
                 return {
                     "video_url": "https://sample-videos.com/zip/10/mp4/SampleVideo_1280x720_1mb.mp4",
-                    "talk_id": f"mock_{datetime.now().timestamp()}",
+                    "talk_id": f"mock_{now.timestamp()}",
                     "avatar_type": avatar_type,
                     "status": "completed",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": now.isoformat(),
                     "mock": True
                 }
             
-            # Upload audio to D-ID
-            audio_url = await self._upload_audio(audio_data, user_id)
+            # Short canned replies may have a pre-rendered video, skipping D-ID entirely
+            if text and voice and len(text) <= self.canned_max_chars:
+                canned_key = self.canned_avatar_key(text, voice, avatar_type)
+                rendered = await self.cache.track_canned_reply(f"{avatar_type}|{voice}|{text}", canned_key) if self.cache else None
+                if rendered is None:
+                    # No Redis registry to consult - ask storage directly
+                    canned_url = await self.storage_service.get_canned_avatar_url(canned_key)
+                else:
+                    canned_url = self.storage_service.canned_avatar_url(canned_key) if rendered else None
+                if canned_url:
+                    logger.info(f"Canned avatar hit for {avatar_type} avatar")
+                    return {
+                        "video_url": canned_url,
+                        "talk_id": f"canned_{canned_key}",
+                        "avatar_type": avatar_type,
+                        "status": "completed",
+                        "timestamp": datetime.now().isoformat(),
+                        "canned": True
+                    }
+            
+            # Identical audio renders an identical video
+            cache_key = f"did:{avatar_type}:{hashlib.sha256(audio_data).hexdigest()}"
+            if self.cache:
+                cached = await self.cache.get(cache_key)
+                if cached:
+                    logger.info(f"Avatar cache hit for {avatar_type} avatar")
+                    return orjson.loads(cached)
             
+            # Identical concurrent requests share one D-ID render
+            return await self._inflight.run(
+                cache_key, lambda: self._render_talk(audio_data, avatar_type, user_id, audio_format, cache_key)
+            )
+            
+        except Exception as e:
+            logger.error(f"D-ID Error: {str(e)}")
+            raise Exception(f"Avatar generation failed: {str(e)}")
+    
+    async def _render_talk(self, audio_data: bytes, avatar_type: str, user_id: str, audio_format: str, cache_key: Optional[str], canned_key: str = None) -> Dict[str, Any]:
+        """Render a talking avatar video with D-ID, cache it to Azure and Redis"""
+        # Upload audio to D-ID while the rest of the request is prepared
+        audio_upload_task = asyncio.create_task(self._upload_audio(audio_data, user_id, audio_format))
+        
+        try:
             # Create talking video
             payload = {
                 "source_url": self.default_avatars[avatar_type]["source_url"],
-                "script": {
-                    "type": "audio",
-                    "audio_url": audio_url
-                },
                 "config": self.default_avatars[avatar_type]["config"]
             }
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/talks",
-                    headers=self.headers,
-                    json=payload
-                )
-                
-                if response.status_code != 201:
-                    raise Exception(f"D-ID API error: {response.status_code} - {response.text}")
-                
-                talk_data = response.json()
-                talk_id = talk_data["id"]
-                
-                logger.info(f"D-ID talk created with ID: {talk_id}")
-                
-                # Poll for completion
-                video_url = await self._wait_for_completion(talk_id)
-                
-                # Download and upload to Azure storage for CDN delivery
-                azure_video_url = await self._cache_video_to_azure(video_url, user_id, talk_id)
-                
-                return {
-                    "video_url": azure_video_url or video_url,  # Fallback to D-ID URL
-                    "original_url": video_url,
-                    "talk_id": talk_id,
-                    "avatar_type": avatar_type,
-                    "status": "completed",
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-        except Exception as e:
-            logger.error(f"D-ID Error: {str(e)}")
-            raise Exception(f"Avatar generation failed: {str(e)}")
+            # Let D-ID push completion to us instead of being polled
+            if self.webhook_url:
+                payload["webhook"] = self.webhook_url
+        except Exception:
+            audio_upload_task.cancel()
+            raise
+        
+        payload["script"] = {
+            "type": "audio",
+            "audio_url": await audio_upload_task
+        }
+        
+        response = await self._client.post(
+            f"{self.base_url}/talks",
+            headers=self.headers,
+            json=payload
+        )
+        
+        if response.status_code != 201:
+            raise Exception(f"D-ID API error: {response.status_code} - {response.text}")
+        
+        talk_data = response.json()
+        talk_id = talk_data["id"]
+        
+        logger.info(f"D-ID talk created with ID: {talk_id}")
+        
+        # Only webhooks for talks we created (and still wait on) are accepted
+        if self.webhook_url:
+            try:
+                await self.queue_service.expect_talk(talk_id)
+            except Exception as e:
+                logger.warning(f"Could not register talk {talk_id} for webhook delivery: {str(e)}")
+        
+        # Wait for completion
+        video_url = await self._wait_for_completion(talk_id)
+        
+        # Download and upload to Azure storage for CDN delivery
+        azure_video_url = await self._cache_video_to_azure(video_url, user_id, talk_id, canned_key=canned_key)
+        
+        result = {
+            "video_url": azure_video_url or video_url,  # Fallback to D-ID URL
+            "original_url": video_url,
+            "talk_id": talk_id,
+            "avatar_type": avatar_type,
+            "status": "completed",
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        if self.cache and cache_key:
+            await self.cache.set(cache_key, orjson.dumps(result))
+        
+        return result
     
-    async def _upload_audio(self, audio_data: bytes, user_id: str) -> str:
+    @staticmethod
+    def canned_avatar_key(text: str, voice: str, avatar_type: str) -> str:
+        """Key of a pre-rendered avatar video for a reply text, voice and avatar"""
+        text_hash = hashlib.blake2b(" ".join(text.lower().split()).encode(), digest_size=16).hexdigest()
+        return hashlib.blake2b(f"{avatar_type}|{voice}|{text_hash}".encode(), digest_size=16).hexdigest()
+    
+    async def render_canned_avatar(self, audio_data: bytes, avatar_type: str, audio_format: str, canned_key: str) -> Optional[str]:
+        """Render a canned reply with D-ID straight into the canned avatar store"""
+        if not self.api_key:
+            return None
+        result = await self._render_talk(audio_data, avatar_type, "canned", audio_format, None, canned_key=canned_key)
+        return result["video_url"] if result["video_url"] != result["original_url"] else None
+    
+    async def _upload_audio(self, audio_data: bytes, user_id: str, audio_format: str = "wav") -> str:
         """Upload audio file to D-ID and return URL"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                files = {"audio": ("audio.wav", audio_data, "audio/wav")}
-                response = await client.post(
-                    f"{self.base_url}/clips",
-                    headers={"Authorization": self.headers["Authorization"]},
-                    files=files
-                )
-                
-                if response.status_code != 201:
-                    raise Exception(f"Audio upload failed: {response.status_code} - {response.text}")
-                
-                audio_url = response.json()["url"]
-                logger.info(f"Audio uploaded to D-ID: {audio_url}")
-                return audio_url
-                
+            mime_type = "audio/mpeg" if audio_format == "mp3" else f"audio/{audio_format}"
+            files = {"audio": (f"audio.{audio_format}", audio_data, mime_type)}
+            response = await self._client.post(
+                f"{self.base_url}/clips",
+                headers={"Authorization": self.headers["Authorization"]},
+                files=files,
+                timeout=30.0
+            )
+            
+            if response.status_code != 201:
+                raise Exception(f"Audio upload failed: {response.status_code} - {response.text}")
+            
+            audio_url = response.json()["url"]
+            logger.info(f"Audio uploaded to D-ID: {audio_url}")
+            return audio_url
+            
         except Exception as e:
             logger.error(f"Audio upload error: {str(e)}")
             raise
     
     async def _wait_for_completion(self, talk_id: str, max_wait: int = 120) -> str:
-        """Wait for D-ID video generation to complete"""
-        start_time = datetime.now()
-        
-        async with httpx.AsyncClient() as client:
-            while (datetime.now() - start_time).seconds < max_wait:
-                response = await client.get(
-                    f"{self.base_url}/talks/{talk_id}",
-                    headers=self.headers
-                )
-                
-                if response.status_code != 200:
-                    raise Exception(f"Status check failed: {response.status_code}")
-                
-                data = response.json()
-                status = data.get("status")
-                
-                logger.info(f"D-ID talk {talk_id} status: {status}")
-                
-                if status == "done":
-                    return data.get("result_url")
-                elif status == "error":
-                    raise Exception(f"D-ID generation failed: {data.get('error', 'Unknown error')}")
+        """Wait for D-ID video generation to complete (webhook wake-up with status polling alongside)"""
+        use_webhook = bool(self.webhook_url)
+        
+        # With a webhook the polls are only a safety net, so they start slower
+        base_delay, max_delay = (2.0, 15.0) if use_webhook else (0.5, 5.0)
+        deadline = time.monotonic() + max_wait
+        attempt = 0
+        
+        while True:
+            response = await self._client.get(
+                f"{self.base_url}/talks/{talk_id}",
+                headers=self.headers
+            )
+            
+            if response.status_code != 200:
+                raise Exception(f"Status check failed: {response.status_code}")
+            
+            result_url = self._talk_result_url(talk_id, response.json())
+            if result_url:
+                return result_url
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            
+            # Probe often early (short talks finish quickly), back off later
+            delay = min(base_delay * (1.5 ** attempt), max_delay, remaining)
+            attempt += 1
+            
+            if use_webhook:
+                try:
+                    data = await self.queue_service.wait_talk_result(talk_id, timeout=delay)
+                except Exception as e:
+                    logger.warning(f"Webhook wait failed for talk {talk_id}: {str(e)}")
+                    use_webhook = False
+                    await asyncio.sleep(delay)
+                    continue
                 
-                # Wait before next check
-                await asyncio.sleep(3)
+                # The webhook only wakes us - the result itself is re-read from D-ID on the next poll
+                if data:
+                    logger.info(f"D-ID webhook received for talk {talk_id}")
+            else:
+                await asyncio.sleep(delay)
         
         raise Exception("Video generation timeout")
     
-    async def _cache_video_to_azure(self, video_url: str, user_id: str, video_id: str) -> Optional[str]:
+    async def _track_did_response(self, response: httpx.Response):
+        """Remember when the pool last talked to D-ID so warmup can skip a live connection"""
+        if str(response.request.url).startswith(self.base_url):
+            self._did_response_at = time.monotonic()
+    
+    async def warmup(self):
+        """Prime the pooled HTTP/2 connection to D-ID ahead of avatar generation"""
+        if not self.api_key:
+            return
+        # A D-ID response within the keep-alive window means the pool still holds an open connection
+        if time.monotonic() - self._did_response_at < self._keepalive_expiry:
+            return
+        try:
+            await self._client.get(f"{self.base_url}/talks", headers=self.headers, params={"limit": 1}, timeout=5.0)
+        except Exception as e:
+            logger.debug(f"D-ID warmup failed: {str(e)}")
+    
+    async def aclose(self):
+        """Close the shared HTTP client"""
+        await self._client.aclose()
+    
+    def _talk_result_url(self, talk_id: str, data: dict) -> Optional[str]:
+        """Return the result URL of a finished talk, None while it is still processing"""
+        status = data.get("status")
+        
+        logger.info(f"D-ID talk {talk_id} status: {status}")
+        
+        if status == "done":
+            return data.get("result_url")
+        elif status == "error":
+            raise Exception(f"D-ID generation failed: {data.get('error', 'Unknown error')}")
+        return None
+    
+    async def _cache_video_to_azure(self, video_url: str, user_id: str, video_id: str, canned_key: str = None) -> Optional[str]:
         """Download video from D-ID and upload to Azure storage for CDN"""
         try:
             if not self.storage_service.blob_service:
                 return None
                 
-            # Download video from D-ID
-            async with httpx.AsyncClient() as client:
-                response = await client.get(video_url)
+            # Stream video from D-ID straight into Azure storage - at most a few 1MB blocks are held in memory
+            async with self._client.stream("GET", video_url) as response:
                 if response.status_code == 200:
-                    video_data = response.content
+                    content_length = response.headers.get("content-length")
+                    
+                    length = int(content_length) if content_length else None
                     
-                    # Upload to Azure storage
-                    azure_url = await self.storage_service.upload_avatar_video(
-                        video_data, user_id, video_id
-                    )
+                    if canned_key:
+                        azure_url = await self.storage_service.upload_canned_avatar(
+                            response.aiter_bytes(65536), canned_key, length=length
+                        )
+                    else:
+                        azure_url = await self.storage_service.upload_avatar_video(
+                            response.aiter_bytes(65536), user_id, video_id, length=length
+                        )
                     logger.info(f"Video cached to Azure: {azure_url}")
                     return azure_url
-                    
+                
         except Exception as e:
             logger.warning(f"Failed to cache video to Azure: {str(e)}")
             return None
@@ -473,17 +1160,31 @@ class ServerlessAvatarPipeline:
     """Main serverless pipeline orchestrating all AI services with Azure integration"""
     
     def __init__(self):
-        self.stt = STTService()
-        self.llm = LLMService()
-        self.tts = TTSService()
-        self.did = DIDService()
+        # Single async OpenAI client shared by STT/LLM/TTS
+        self.openai_client = create_openai_client()
+        self.cache = RedisCacheService()
+        self.stt = STTService(self.openai_client)
+        self.llm = LLMService(self.openai_client, self.cache)
+        self.tts = TTSService(self.openai_client, self.cache)
         self.queue_service = RedisQueueService()
+        self.did = DIDService(self.cache, self.queue_service)
         
-        # User session storage (Redis-backed in production)
+        # User session storage (Redis-backed, in-memory fallback when Redis is not configured)
         self.user_sessions = {}
+        self.session_ttl = 3600
+        self.max_history = 20
+        self.min_transcript_chars = 2
+        
+        # immediate: render avatars in the request; queued: hand off to avatar_worker.py
+        self.processing_mode = os.getenv("PROCESSING_MODE", "immediate")
+        
+        # Strong references to fire-and-forget tasks
+        self._background_tasks = set()
     
     async def process_audio_input(self, audio_data: bytes, user_id: str, avatar_type: str = "female", voice: str = "alloy") -> Dict[str, Any]:
         """Full serverless pipeline: Audio -> STT -> LLM -> TTS -> Avatar"""
+        now_iso = datetime.now().isoformat()
+        
         try:
             logger.info(f"Processing audio input for user {user_id}")
             
@@ -491,24 +1192,34 @@ class ServerlessAvatarPipeline:
             transcribed_text = await self.stt.transcribe_audio(audio_data)
             logger.info(f"Transcribed: {transcribed_text}")
             
-            # Step 2: Generate AI response
-            conversation_history = self.user_sessions.get(user_id, [])
-            llm_response = await self.llm.generate_response(transcribed_text, user_id, conversation_history)
+            # Silence / noise: skip LLM, TTS and avatar generation entirely
+            if len(transcribed_text.strip()) < self.min_transcript_chars:
+                logger.info(f"No speech detected for user {user_id}, skipping pipeline")
+                return {
+                    "transcribed_text": transcribed_text,
+                    "error": "No speech detected. Please try again.",
+                    "status": "no_speech_detected",
+                    "timestamp": now_iso
+                }
+            
+            # Step 2 & 3: Stream AI response into Text to Speech
+            conversation_history = await self._get_conversation_history(user_id)
+            llm_response, audio_response = await self._generate_spoken_response(
+                transcribed_text, user_id, conversation_history, voice
+            )
             
             # Update conversation history
-            self._update_conversation_history(user_id, transcribed_text, llm_response["text"])
-            
-            # Step 3: Text to Speech
-            audio_response = await self.tts.synthesize_speech(llm_response["text"], voice, user_id)
+            await self._update_conversation_history(user_id, transcribed_text, llm_response["text"])
             
             # Step 4: Generate talking avatar
-            avatar_result = await self._process_avatar_generation(audio_response, avatar_type, user_id)
+            avatar_result = await self._process_avatar_generation(audio_response, avatar_type, user_id, llm_response["text"], voice)
             
             return {
                 "transcribed_text": transcribed_text,
                 "ai_response_text": llm_response["text"],
                 "avatar_video_url": avatar_result["video_url"],
-                "processing_time": datetime.now().isoformat(),
+                "avatar_task_id": avatar_result.get("task_id"),
+                "processing_time": now_iso,
                 "tokens_used": llm_response["tokens_used"],
                 "status": "success"
             }
@@ -518,32 +1229,34 @@ class ServerlessAvatarPipeline:
             return {
                 "error": str(e),
                 "status": "failed",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": now_iso
             }
     
     async def process_text_input(self, text: str, user_id: str, avatar_type: str = "female", voice: str = "alloy") -> Dict[str, Any]:
         """Serverless pipeline for direct text input: Text -> LLM -> TTS -> Avatar"""
+        now_iso = datetime.now().isoformat()
+        
         try:
             logger.info(f"Processing text input for user {user_id}: {text}")
             
-            # Step 1: Generate AI response
-            conversation_history = self.user_sessions.get(user_id, [])
-            llm_response = await self.llm.generate_response(text, user_id, conversation_history)
+            # Step 1 & 2: Stream AI response into Text to Speech
+            conversation_history = await self._get_conversation_history(user_id)
+            llm_response, audio_response = await self._generate_spoken_response(
+                text, user_id, conversation_history, voice
+            )
             
             # Update conversation history
-            self._update_conversation_history(user_id, text, llm_response["text"])
-            
-            # Step 2: Text to Speech
-            audio_response = await self.tts.synthesize_speech(llm_response["text"], voice, user_id)
+            await self._update_conversation_history(user_id, text, llm_response["text"])
             
             # Step 3: Generate talking avatar
-            avatar_result = await self._process_avatar_generation(audio_response, avatar_type, user_id)
+            avatar_result = await self._process_avatar_generation(audio_response, avatar_type, user_id, llm_response["text"], voice)
             
             return {
                 "user_input": text,
                 "ai_response_text": llm_response["text"],
                 "avatar_video_url": avatar_result["video_url"],
-                "processing_time": datetime.now().isoformat(),
+                "avatar_task_id": avatar_result.get("task_id"),
+                "processing_time": now_iso,
                 "tokens_used": llm_response["tokens_used"],
                 "status": "success"
             }
@@ -553,32 +1266,145 @@ class ServerlessAvatarPipeline:
             return {
                 "error": str(e),
                 "status": "failed",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": now_iso
             }
     
-    async def _process_avatar_generation(self, audio_data: bytes, avatar_type: str, user_id: str) -> Dict[str, Any]:
+    async def _generate_spoken_response(self, user_input: str, user_id: str, conversation_history: list, voice: str) -> Tuple[Dict[str, Any], bytes]:
+        """Stream LLM sentences into TTS so speech synthesis starts at the first sentence boundary"""
+        sentences = []
+        tts_tasks = []
+        response_info = {}
+        
+        # Open the D-ID connection while the LLM is still streaming - queued mode renders in a worker instead
+        if self.processing_mode != "queued":
+            warmup_task = asyncio.create_task(self.did.warmup())
+            self._background_tasks.add(warmup_task)
+            warmup_task.add_done_callback(self._background_tasks.discard)
+        
+        try:
+            async for sentence in self.llm.stream_response(user_input, user_id, conversation_history, response_info):
+                sentences.append(sentence)
+                tts_tasks.append(asyncio.create_task(self.tts.synthesize_speech(sentence, voice, user_id)))
+            
+            audio_chunks = await asyncio.gather(*tts_tasks)
+            
+        except Exception:
+            for task in tts_tasks:
+                task.cancel()
+            raise
+        
+        if not sentences:
+            raise Exception("AI response generation failed: empty response")
+        
+        llm_response = {
+            "text": " ".join(sentences),
+            "model": self.llm.model,
+            "tokens_used": response_info.get("tokens_used", 0)
+        }
+        
+        return llm_response, concat_audio(audio_chunks, self.tts.response_format)
+    
+    async def _process_avatar_generation(self, audio_data: bytes, avatar_type: str, user_id: str, text: str = None, voice: str = None) -> Dict[str, Any]:
         """Process avatar generation with intelligent scaling"""
         try:
-            # For now, process immediately - can be enhanced with queueing later
-            return await self.did.create_talking_avatar(audio_data, avatar_type, user_id)
+            if self.processing_mode == "queued":
+                # Hand D-ID rendering to a stream worker and free the request immediately
+                task_id = await self.queue_service.add_processing_task({
+                    "op": "did",
+                    "audio_b64": await b64encode_audio(audio_data),
+                    "audio_format": self.tts.response_format,
+                    "avatar_type": avatar_type,
+                    "user_id": user_id,
+                    "text": text,
+                    "voice": voice
+                })
+                return {"video_url": None, "task_id": task_id, "status": "queued"}
+            
+            return await self.did.create_talking_avatar(
+                audio_data, avatar_type, user_id, self.tts.response_format, text=text, voice=voice
+            )
                 
         except Exception as e:
             logger.error(f"Avatar generation error: {str(e)}")
             raise
     
-    def _update_conversation_history(self, user_id: str, user_message: str, ai_response: str):
-        """Update conversation history for context"""
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = []
+    async def process_avatar_task(self, task_data: dict) -> Dict[str, Any]:
+        """Run a queued avatar generation task (called by stream workers)"""
+        if task_data.get("op") != "did":
+            raise Exception(f"Unknown task operation: {task_data.get('op')}")
         
-        self.user_sessions[user_id].extend([
+        return await self.did.create_talking_avatar(
+            await b64decode_audio(task_data["audio_b64"]),
+            task_data.get("avatar_type", "female"),
+            task_data.get("user_id"),
+            task_data.get("audio_format", "wav"),
+            text=task_data.get("text"),
+            voice=task_data.get("voice")
+        )
+    
+    async def _get_session_store(self):
+        """Return the Redis client used for conversation sessions, if available"""
+        if not self.queue_service.redis_client and self.queue_service.redis_url:
+            await self.queue_service.connect()
+        return self.queue_service.redis_client
+    
+    async def _get_conversation_history(self, user_id: str) -> list:
+        """Load conversation history for context"""
+        redis_client = await self._get_session_store()
+        if not redis_client:
+            return self.user_sessions.get(user_id, [])[-self.llm.context_messages:]
+        
+        try:
+            # Only fetch the messages the LLM will use as context
+            messages = await redis_client.lrange(f"sess:{user_id}", -self.llm.context_messages, -1)
+            return [orjson.loads(message) for message in messages]
+        except Exception as e:
+            logger.warning(f"Failed to load session for {user_id}: {str(e)}")
+            return []
+    
+    async def _update_conversation_history(self, user_id: str, user_message: str, ai_response: str):
+        """Update conversation history for context"""
+        exchange = [
             {"role": "user", "content": user_message},
             {"role": "assistant", "content": ai_response}
-        ])
+        ]
         
-        # Keep only last 20 messages (10 exchanges)
-        if len(self.user_sessions[user_id]) > 20:
-            self.user_sessions[user_id] = self.user_sessions[user_id][-20:]
+        redis_client = await self._get_session_store()
+        if not redis_client:
+            session = self.user_sessions.setdefault(user_id, [])
+            session.extend(exchange)
+            
+            # Keep only last 20 messages (10 exchanges)
+            if len(session) > self.max_history:
+                del session[:-self.max_history]
+            return
+        
+        try:
+            session_key = f"sess:{user_id}"
+            
+            # Append, cap to last 20 messages and refresh TTL in a single round-trip
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.rpush(session_key, *(orjson.dumps(message) for message in exchange))
+                pipe.ltrim(session_key, -self.max_history, -1)
+                pipe.expire(session_key, self.session_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to update session for {user_id}: {str(e)}")
+    
+    async def prerender_canned_avatar(self, text: str, voice: str = "alloy", avatar_type: str = "female") -> Optional[str]:
+        """Render a canned reply once and store it so later requests bypass D-ID (run offline)"""
+        audio_data = await self.tts.synthesize_speech(text, voice)
+        canned_key = self.did.canned_avatar_key(text, voice, avatar_type)
+        
+        canned_url = await self.did.render_canned_avatar(audio_data, avatar_type, self.tts.response_format, canned_key)
+        if canned_url:
+            await self.cache.register_canned_avatar(canned_key)
+        return canned_url
+    
+    async def aclose(self):
+        """Release pooled connections held by the services"""
+        await self.did.aclose()
+        await self.openai_client.close()
     
     async def get_available_voices(self) -> Dict[str, list]:
         """Get available TTS voices"""
@@ -593,49 +1419,47 @@ class ServerlessAvatarPipeline:
             "timestamp": datetime.now().isoformat(),
             "services": {},
             "environment": os.getenv("ENVIRONMENT", "unknown"),
-            "processing_mode": os.getenv("PROCESSING_MODE", "immediate")
+            "processing_mode": self.processing_mode
         }
         
-        # Check OpenAI API
-        try:
-            test_response = await self.llm.generate_response("Hello", "health_check")
-            health_status["services"]["llm"] = "healthy"
-        except Exception as e:
-            health_status["services"]["llm"] = f"unhealthy: {str(e)}"
+        async def _check_llm():
+            # Listing models is free, unlike a completion
+            await asyncio.wait_for(self.llm.client.models.list(), timeout=10.0)
+            return "llm", "healthy"
         
-        # Check D-ID API
-        try:
-            if self.did.api_key:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"{self.did.base_url}/talks",
-                        headers=self.did.headers,
-                        timeout=10.0
-                    )
-                    if response.status_code in [200, 401]:
-                        health_status["services"]["did"] = "healthy"
-                    else:
-                        health_status["services"]["did"] = f"unhealthy: HTTP {response.status_code}"
-            else:
-                health_status["services"]["did"] = "not configured"
-        except Exception as e:
-            health_status["services"]["did"] = f"unhealthy: {str(e)}"
+        async def _check_did():
+            if not self.did.api_key:
+                return "did", "not configured"
+            response = await self.did._client.get(
+                f"{self.did.base_url}/talks",
+                headers=self.did.headers,
+                timeout=10.0
+            )
+            if response.status_code in [200, 401]:
+                return "did", "healthy"
+            return "did", f"unhealthy: HTTP {response.status_code}"
         
-        # Check Azure Storage
-        if self.did.storage_service.blob_service:
-            health_status["services"]["azure_storage"] = "healthy"
-        else:
-            health_status["services"]["azure_storage"] = "not configured"
+        async def _check_storage():
+            if self.did.storage_service.blob_service:
+                return "azure_storage", "healthy"
+            return "azure_storage", "not configured"
         
-        # Check Redis
-        try:
+        async def _check_redis():
             await self.queue_service.connect()
-            if self.queue_service.redis_client:
-                health_status["services"]["redis"] = "healthy"
+            if not self.queue_service.redis_client:
+                return "redis", "not configured"
+            await asyncio.wait_for(self.queue_service.redis_client.ping(), timeout=10.0)
+            return "redis", "healthy"
+        
+        # Probe all services concurrently - total time is the slowest probe, not the sum
+        checks = {"llm": _check_llm, "did": _check_did, "azure_storage": _check_storage, "redis": _check_redis}
+        results = await asyncio.gather(*(check() for check in checks.values()), return_exceptions=True)
+        
+        for name, result in zip(checks, results):
+            if isinstance(result, BaseException):
+                health_status["services"][name] = f"unhealthy: {str(result)}"
             else:
-                health_status["services"]["redis"] = "not configured"
-        except Exception as e:
-            health_status["services"]["redis"] = f"unhealthy: {str(e)}"
+                health_status["services"][result[0]] = result[1]
         
         return health_status
 
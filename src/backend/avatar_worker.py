@@ -0,0 +1,89 @@
+# src/backend/avatar_worker.py - Redis stream worker for queued avatar generation
+
+import asyncio
+import os
+import socket
+import time
+import logging
+
+from avatar_ai_services import avatar_pipeline
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+async def handle_task(entry_id: str, task_data: dict):
+    """Process one queued task and publish its result to the waiting request"""
+    queue_service = avatar_pipeline.queue_service
+    task_id = task_data.get("task_id")
+
+    try:
+        result = await avatar_pipeline.process_avatar_task(task_data)
+    except Exception as e:
+        logger.error(f"Task {task_id} failed: {str(e)}")
+        result = {"status": "failed", "error": str(e)}
+
+    # Let an identical retry enqueue a fresh task instead of getting this failure back
+    if result.get("status") == "failed" and task_id and task_data.get("dedupe_digest"):
+        await queue_service.release_dedupe(task_data["dedupe_digest"], task_id)
+
+    try:
+        if task_id:
+            await queue_service.set_task_result(task_id, result)
+        await queue_service.ack_task(entry_id)
+    except Exception as e:
+        # Left unacknowledged - reclaimed by claim_stale_tasks once idle long enough
+        logger.error(f"Failed to publish result for task {task_id}: {str(e)}")
+
+async def run_worker(consumer: str, batch_size: int = 8, block_ms: int = 30000, claim_idle_ms: int = 300000):
+    """Consume the avatar stream with XREADGROUP ... BLOCK, processing each batch concurrently"""
+    queue_service = avatar_pipeline.queue_service
+    logger.info(f"Avatar worker {consumer} starting")
+
+    # Finish tasks this consumer read but never acknowledged before a restart
+    pending = True
+    next_claim = 0.0
+
+    while True:
+        try:
+            # Entries of consumers that went away (pod names change on restart) are
+            # claimed once idle for claim_idle_ms
+            if not pending and time.monotonic() >= next_claim:
+                next_claim = time.monotonic() + claim_idle_ms / 1000 / 2
+                tasks = await queue_service.claim_stale_tasks(consumer, claim_idle_ms, count=batch_size)
+                if tasks:
+                    # Keep claiming until the backlog of stale entries is drained
+                    next_claim = 0.0
+                    logger.info(f"Worker {consumer} claimed {len(tasks)} stale tasks")
+                    await asyncio.gather(*(handle_task(entry_id, task_data) for entry_id, task_data in tasks))
+                    continue
+
+            tasks = await queue_service.read_tasks(consumer, count=batch_size, block_ms=block_ms, pending=pending)
+            if pending and not tasks:
+                pending = False
+                continue
+
+            if tasks:
+                await asyncio.gather(*(handle_task(entry_id, task_data) for entry_id, task_data in tasks))
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Worker {consumer} error: {str(e)}")
+            await asyncio.sleep(1)
+
+async def main():
+    consumer = os.getenv("WORKER_NAME", socket.gethostname())
+    batch_size = int(os.getenv("WORKER_BATCH_SIZE", 8))
+    claim_idle_ms = int(os.getenv("WORKER_CLAIM_IDLE_MS", 300000))
+
+    try:
+        await run_worker(consumer, batch_size, claim_idle_ms=claim_idle_ms)
+    finally:
+        await avatar_pipeline.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+# src/backend/canned_avatar_job.py - Offline job pre-rendering avatar videos for frequent short replies
+
+import asyncio
+import os
+import logging
+
+from avatar_ai_services import avatar_pipeline
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+async def run_job(top_n: int = 20, min_count: int = 3, keep: int = 1000):
+    """Render the top_n most frequent short replies that have no canned video yet, then trim the stats"""
+    cache = avatar_pipeline.cache
+    did = avatar_pipeline.did
+    rendered = 0
+
+    for member, count in await cache.top_canned_replies(top_n):
+        if count < min_count:
+            break
+
+        # Members are "avatar_type|voice|text" (see DIDService.create_talking_avatar)
+        avatar_type, voice, text = member.split("|", 2)
+        canned_key = did.canned_avatar_key(text, voice, avatar_type)
+        if await cache.is_canned_avatar_registered(canned_key):
+            continue
+
+        try:
+            canned_url = await avatar_pipeline.prerender_canned_avatar(text, voice, avatar_type)
+            if canned_url:
+                rendered += 1
+                logger.info(f"Pre-rendered canned avatar ({int(count)} uses): {canned_url}")
+        except Exception as e:
+            logger.error(f"Failed to pre-render canned reply '{text}': {str(e)}")
+
+    # Keep the usage stats bounded - only the most frequent replies matter
+    await cache.trim_canned_stats(keep)
+    logger.info(f"Canned avatar job finished, {rendered} videos rendered")
+
+async def main():
+    top_n = int(os.getenv("CANNED_PRERENDER_TOP", 20))
+    min_count = int(os.getenv("CANNED_PRERENDER_MIN_COUNT", 3))
+    keep = int(os.getenv("CANNED_STATS_KEEP", 1000))
+
+    try:
+        await run_job(top_n, min_count, keep)
+    finally:
+        await avatar_pipeline.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,21 @@
 # src/backend/main.py - Complete integrated backend for Avatar AI System
 
 import asyncio
-import json
-import base64
-import tempfile
+import hmac
+import orjson
+import ormsgpack
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple, Union
 import logging
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 import uvicorn
 
 # Import our AI services
@@ -25,11 +28,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# D-ID posts here with DID_WEBHOOK_SECRET in the query string (see DIDService.webhook_url)
+DID_WEBHOOK_PATH = "/api/webhooks/did"
+
+class WebhookTokenFilter(logging.Filter):
+    """Drop the query string, and with it the webhook secret, from the D-ID webhook's access log lines"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn.access args: (client_addr, method, full_path, http_version, status_code)
+        args = record.args
+        if isinstance(args, tuple) and len(args) == 5 and str(args[2]).startswith(DID_WEBHOOK_PATH + "?"):
+            record.args = (args[0], args[1], DID_WEBHOOK_PATH, args[3], args[4])
+        return True
+
+# uvicorn.access also carries gunicorn's --access-logfile lines under AvatarUvicornWorker
+logging.getLogger("uvicorn.access").addFilter(WebhookTokenFilter())
+
 # FastAPI app initialization
 app = FastAPI(
     title="Avatar AI System",
     description="Real-time AI Avatar with Speech, Text, and Video Generation",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -45,48 +65,303 @@ app.add_middleware(
 if os.path.exists("../frontend"):
     app.mount("/static", StaticFiles(directory="../frontend"), name="static")
 
+class TextRequest(BaseModel):
+    """Request body of the HTTP text endpoints"""
+    text: str = "Hello, how are you?"
+    user_id: str = "test_user"
+    avatar_type: str = "female"
+    voice: str = "alloy"
+
+class TextInputMsg(BaseModel):
+    """WebSocket text_input message"""
+    type: Literal["text_input"]
+    text: str = ""
+    avatar_type: str = "female"
+    voice: str = "alloy"
+
+class AudioInputMsg(BaseModel):
+    """WebSocket audio_input message - audio_data is only set inline by msgpack clients"""
+    type: Literal["audio_input"]
+    avatar_type: str = "female"
+    voice: str = "alloy"
+    audio_data: Optional[bytes] = None
+
+class PingMsg(BaseModel):
+    """WebSocket keepalive message"""
+    type: Literal["ping"]
+
+# Validates any client message in one pass, dispatching on the "type" tag
+CLIENT_MESSAGE = TypeAdapter(Annotated[Union[TextInputMsg, AudioInputMsg, PingMsg], Field(discriminator="type")])
+CLIENT_MESSAGE_TYPES = ("text_input", "audio_input", "ping")
+
+# Pre-serialized envelopes for the most frequent static frames - only the timestamp varies
+WELCOME_TMPL = b'{"type":"system","message":"Connected to Avatar AI! Ready to chat.","user_id":%s,"timestamp":"%s"}'
+PONG_TMPL = b'{"type":"pong","timestamp":"%s"}'
+INVALID_JSON_TMPL = b'{"type":"error","message":"Invalid JSON format","timestamp":"%s"}'
+TEXT_PROCESSING_TMPL = b'{"type":"processing","message":"AI is generating response...","timestamp":"%s"}'
+AUDIO_PROCESSING_TMPL = b'{"type":"processing","message":"Processing voice input...","timestamp":"%s"}'
+
+# Last rendered frame per timestamp-only template, shared by every send within a clock tick
+_STATIC_FRAMES: Dict[bytes, Tuple[str, bytes]] = {}
+
+def static_frame(template: bytes, ts: str) -> bytes:
+    """Render a timestamp-only template, reusing the rendered frame until the timestamp changes"""
+    cached = _STATIC_FRAMES.get(template)
+    if cached is not None and cached[0] == ts:
+        return cached[1]
+    frame = template % ts.encode()
+    _STATIC_FRAMES[template] = (ts, frame)
+    return frame
+
+@dataclass(slots=True)
+class Conn:
+    """State of one WebSocket connection, kept in a single record per user"""
+    ws: WebSocket
+    queue: asyncio.Queue
+    connected_at_ns: int
+    last_activity_ns: int
+    message_count: int = 0
+    msgpack: bool = False
+    text_frames: bool = False
+    writer_task: Optional[asyncio.Task] = None
+
+    def dumps(self, message: dict) -> bytes:
+        """Serialize a message in the wire format negotiated for this connection"""
+        return ormsgpack.packb(message) if self.msgpack else orjson.dumps(message)
+
+    def loads(self, data: Union[bytes, str]) -> Tuple[bool, Any]:
+        """Deserialize a frame in the negotiated wire format, returning (ok, value) instead of raising"""
+        try:
+            return True, (ormsgpack.unpackb(data) if self.msgpack else orjson.loads(data))
+        except (orjson.JSONDecodeError, ormsgpack.MsgpackDecodeError):
+            return False, None
+
+    def metadata(self) -> dict:
+        """Connection metadata with the monotonic clock readings formatted as ISO"""
+        now = datetime.now()
+        now_ns = time.monotonic_ns()
+        return {
+            "connected_at": (now - timedelta(microseconds=(now_ns - self.connected_at_ns) // 1000)).isoformat(),
+            "message_count": self.message_count,
+            "last_activity": (now - timedelta(microseconds=(now_ns - self.last_activity_ns) // 1000)).isoformat()
+        }
+
+# Envelope timestamp refreshed by a background tick - WebSocket envelopes only need ~1s precision
+_NOW_ISO = [datetime.now().isoformat()]
+clock_task: Optional[asyncio.Task] = None
+
+async def _tick_now_iso():
+    """Refresh the cached envelope timestamp twice a second"""
+    while True:
+        _NOW_ISO[0] = datetime.now().isoformat()
+        await asyncio.sleep(0.5)
+
+# Number of connection shards (power of two)
+CONNECTION_BUCKETS = 16
+
+# Frames queued for one connection before its peer is considered dead and dropped
+SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", 256))
+
+# Largest accepted voice message - frames beyond WS_MAX_SIZE are refused by the server itself
+# (uvicorn.run below, and uvicorn_worker.AvatarUvicornWorker under gunicorn)
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", 1_048_576))
+WS_MAX_SIZE = MAX_AUDIO_BYTES + 65536
+
 class ConnectionManager:
-    """WebSocket connection manager for handling multiple users"""
+    """WebSocket connection manager for handling multiple users
+    
+    Connections are per worker process. Messages for a user connected to another
+    worker are relayed over Redis pub/sub on the user:{user_id} channel.
+    """
     
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.user_metadata: Dict[str, Dict] = {}
+        # Connections sharded by user_id hash - keeps each dict small under many connections
+        self.buckets: List[Dict[str, Conn]] = [{} for _ in range(CONNECTION_BUCKETS)]
+        self.redis_client = None
+        self.pubsub = None
+        self.relay_task: Optional[asyncio.Task] = None
+        self.closing_tasks = set()
+
+    def _bucket(self, user_id: str) -> Dict[str, Conn]:
+        """Shard holding the given user's connection"""
+        return self.buckets[hash(user_id) & (CONNECTION_BUCKETS - 1)]
+
+    def get(self, user_id: str) -> Optional[Conn]:
+        """Connection of the given user on this worker, if any"""
+        return self._bucket(user_id).get(user_id)
+
+    def count(self) -> int:
+        """Number of connections on this worker"""
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def items(self) -> List[Tuple[str, Conn]]:
+        """Snapshot of (user_id, connection) pairs across all shards"""
+        return [item for bucket in self.buckets for item in bucket.items()]
 
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str, use_msgpack: bool = False, text_frames: bool = False) -> Conn:
         """Accept WebSocket connection and register user"""
         await websocket.accept()
-        self.active_connections[user_id] = websocket
-        self.user_metadata[user_id] = {
-            "connected_at": datetime.now().isoformat(),
-            "message_count": 0,
-            "last_activity": datetime.now().isoformat()
-        }
-        logger.info(f"User {user_id} connected. Total active: {len(self.active_connections)}")
+        now_ns = time.monotonic_ns()
+        conn = Conn(
+            ws=websocket,
+            queue=asyncio.Queue(maxsize=SEND_QUEUE_MAX),
+            connected_at_ns=now_ns,
+            last_activity_ns=now_ns,
+            msgpack=use_msgpack,
+            text_frames=text_frames
+        )
+        
+        # One writer task per connection drains its send queue
+        conn.writer_task = asyncio.create_task(self._writer(user_id, conn))
+        replaced = self._bucket(user_id).get(user_id)
+        self._bucket(user_id)[user_id] = conn
+        
+        # A reconnect under the same user_id supersedes the old connection's writer
+        if replaced and replaced.writer_task:
+            replaced.writer_task.cancel()
+        logger.info(f"User {user_id} connected. Total active: {self.count()}")
+        return conn
 
-    def disconnect(self, user_id: str):
-        """Remove user connection"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        if user_id in self.user_metadata:
-            del self.user_metadata[user_id]
-        logger.info(f"User {user_id} disconnected. Total active: {len(self.active_connections)}")
+    def disconnect(self, user_id: str, conn: Optional[Conn] = None):
+        """Remove user connection - only if it is still conn, when given, so a reconnect is left alone"""
+        bucket = self._bucket(user_id)
+        registered = bucket.get(user_id)
+        if conn is None:
+            conn = registered
+        if registered is conn:
+            bucket.pop(user_id, None)
+        if conn and conn.writer_task and conn.writer_task is not asyncio.current_task():
+            conn.writer_task.cancel()
+        logger.info(f"User {user_id} disconnected. Total active: {self.count()}")
+
+    async def close_all(self) -> int:
+        """Close every connection concurrently and clear all shards, returning how many were closed"""
+        conns = [conn for bucket in self.buckets for conn in bucket.values()]
+        await asyncio.gather(*(conn.ws.close() for conn in conns), return_exceptions=True)
+        
+        for conn in conns:
+            if conn.writer_task:
+                conn.writer_task.cancel()
+        for bucket in self.buckets:
+            bucket.clear()
+        return len(conns)
 
     async def send_personal_message(self, message: dict, user_id: str):
         """Send message to specific user"""
-        if user_id in self.active_connections:
+        conn = self.get(user_id)
+        if conn is not None:
+            self._enqueue(user_id, conn, conn.dumps(message))
+        else:
+            await self._publish(orjson.dumps(message), user_id)
+
+    async def send_raw(self, payload: bytes, user_id: str):
+        """Queue an already serialized JSON frame for specific user"""
+        if not self._deliver_local(payload, user_id):
+            await self._publish(payload, user_id)
+
+    def _deliver_local(self, payload: bytes, user_id: str) -> bool:
+        """Queue a JSON frame if the user is connected to this worker"""
+        conn = self.get(user_id)
+        if conn is None:
+            return False
+        if conn.msgpack:
+            # Templates are JSON - re-encode for msgpack clients
+            payload = ormsgpack.packb(orjson.loads(payload))
+        self._enqueue(user_id, conn, payload)
+        return True
+
+    def _enqueue(self, user_id: str, conn: Conn, payload: bytes):
+        """Queue a frame for the writer task, dropping a peer that stopped reading"""
+        try:
+            conn.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning(f"Send queue full for {user_id} - dropping connection")
+            self.disconnect(user_id, conn)
+            task = asyncio.create_task(self._close(user_id, conn, code=1011))
+            self.closing_tasks.add(task)
+            task.add_done_callback(self.closing_tasks.discard)
+            return
+        conn.last_activity_ns = time.monotonic_ns()
+
+    async def _close(self, user_id: str, conn: Conn, code: int = 1000):
+        """Close a connection's socket, ignoring a peer that is already gone"""
+        try:
+            await conn.ws.close(code=code)
+        except Exception as e:
+            logger.debug(f"Error closing connection for {user_id}: {str(e)}")
+
+    async def _publish(self, payload: bytes, user_id: str):
+        """Hand a JSON frame to whichever worker holds the user's connection"""
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.publish(f"user:{user_id}", payload)
+        except Exception as e:
+            logger.error(f"Error relaying message to {user_id}: {str(e)}")
+
+    async def start_relay(self, redis_client):
+        """Subscribe to user:* and deliver relayed frames to local connections"""
+        self.redis_client = redis_client
+        self.pubsub = redis_client.pubsub()
+        await self.pubsub.psubscribe("user:*")
+        self.relay_task = asyncio.create_task(self._relay())
+
+    async def _relay(self):
+        """Deliver frames published by other workers"""
+        while True:
             try:
-                await self.active_connections[user_id].send_text(json.dumps(message))
-                self.user_metadata[user_id]["last_activity"] = datetime.now().isoformat()
+                async for message in self.pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    user_id = (channel.decode() if isinstance(channel, bytes) else channel)[len("user:"):]
+                    self._deliver_local(message["data"], user_id)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"Error sending message to {user_id}: {str(e)}")
-                self.disconnect(user_id)
+                logger.error(f"Pub/sub relay error: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def stop_relay(self):
+        """Stop relaying and close the pub/sub connection"""
+        if self.relay_task:
+            self.relay_task.cancel()
+            self.relay_task = None
+        if self.pubsub:
+            await self.pubsub.close()
+            self.pubsub = None
+        self.redis_client = None
+
+    async def _writer(self, user_id: str, conn: Conn):
+        """Write queued frames, draining everything already queued back to back"""
+        queue = conn.queue
+        try:
+            while True:
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                
+                # Binary frames keep orjson output as bytes end to end - text frames
+                # (?format=text) pay one UTF-8 decode for clients that need them
+                if conn.text_frames:
+                    for payload in batch:
+                        await conn.ws.send_text(payload.decode())
+                else:
+                    for payload in batch:
+                        await conn.ws.send_bytes(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to {user_id}: {str(e)}")
+            self.disconnect(user_id, conn)
 
     def get_connection_stats(self) -> dict:
         """Get current connection statistics"""
+        items = self.items()
         return {
-            "total_connections": len(self.active_connections),
-            "users": list(self.active_connections.keys()),
-            "metadata": self.user_metadata
+            "total_connections": len(items),
+            "users": [user_id for user_id, _ in items],
+            "metadata": {user_id: conn.metadata() for user_id, conn in items}
         }
 
 # Global connection manager
@@ -98,7 +373,7 @@ async def root():
     try:
         return FileResponse("../frontend/index.html")
     except FileNotFoundError:
-        return JSONResponse({
+        return ORJSONResponse({
             "message": "Avatar AI System API", 
             "status": "running", 
             "timestamp": datetime.now().isoformat(),
@@ -112,13 +387,13 @@ async def health_check():
         health_data = await avatar_pipeline.health_check()
         health_data.update({
             "server_status": "healthy",
-            "active_connections": len(manager.active_connections),
+            "active_connections": manager.count(),
             "uptime": "running"
         })
-        return health_data
+        return ORJSONResponse(health_data)
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "server_status": "unhealthy",
@@ -144,99 +419,140 @@ async def get_available_voices():
         return await avatar_pipeline.get_available_voices()
     except Exception as e:
         logger.error(f"Error getting voices: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"error": "Failed to get available voices"}
         )
 
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str):
+async def websocket_endpoint(websocket: WebSocket, user_id: str, format: str = "json"):
     """Main WebSocket endpoint for real-time communication"""
-    await manager.connect(websocket, user_id)
+    # JSON in binary frames by default - ?format=msgpack for msgpack, ?format=text for JSON text frames
+    conn = await manager.connect(websocket, user_id, use_msgpack=format == "msgpack", text_frames=format == "text")
     
     try:
         # Send welcome message
-        welcome_message = {
-            "type": "system",
-            "message": "Connected to Avatar AI! Ready to chat.",
-            "user_id": user_id,
-            "timestamp": datetime.now().isoformat()
-        }
-        await manager.send_personal_message(welcome_message, user_id)
+        ts = _NOW_ISO[0]
+        await manager.send_raw(WELCOME_TMPL % (orjson.dumps(user_id), ts.encode()), user_id)
+        
+        # Header of an audio_input whose audio follows as a binary frame
+        pending_audio_header = None
         
         while True:
             # Receive message from client
             try:
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                data = await receive_frame(websocket)
+                
+                # One cached timestamp per received frame, shared by every envelope it produces
+                ts = _NOW_ISO[0]
                 
                 # Update user activity
-                if user_id in manager.user_metadata:
-                    manager.user_metadata[user_id]["message_count"] += 1
-                    manager.user_metadata[user_id]["last_activity"] = datetime.now().isoformat()
+                conn.message_count += 1
+                conn.last_activity_ns = time.monotonic_ns()
+                
+                # Raw audio frame - hand the bytes over without any JSON decoding
+                if isinstance(data, bytes) and pending_audio_header is not None:
+                    header, pending_audio_header = pending_audio_header, None
+                    await handle_audio_input(header, data, user_id, ts)
+                    continue
+                
+                ok, message_data = conn.loads(data)
+                if not ok:
+                    if conn.msgpack:
+                        error_msg = {
+                            "type": "error",
+                            "message": "Invalid msgpack format",
+                            "timestamp": ts
+                        }
+                        await manager.send_personal_message(error_msg, user_id)
+                    else:
+                        await manager.send_raw(static_frame(INVALID_JSON_TMPL, ts), user_id)
+                    continue
+                
+                try:
+                    message = CLIENT_MESSAGE.validate_python(message_data)
+                except ValidationError:
+                    message_type = message_data.get("type") if isinstance(message_data, dict) else None
+                    error_msg = {
+                        "type": "error",
+                        "message": f"Invalid {message_type} message" if message_type in CLIENT_MESSAGE_TYPES else f"Unknown message type: {message_type}",
+                        "timestamp": ts
+                    }
+                    await manager.send_personal_message(error_msg, user_id)
+                    continue
+                
+                if message.type == "audio_input":
+                    if conn.msgpack:
+                        # msgpack carries the audio inline as a bytes field
+                        await handle_audio_input(message, message.audio_data or b"", user_id, ts)
+                    elif message.audio_data is not None:
+                        # Old protocol (base64 audio inside the JSON) - say so instead of waiting forever
+                        error_msg = {
+                            "type": "error",
+                            "message": "Inline audio_data is not supported - send the audio_input header, then the audio as a binary frame",
+                            "timestamp": ts
+                        }
+                        await manager.send_personal_message(error_msg, user_id)
+                    else:
+                        # JSON audio_input is only a small header - the audio follows as a binary frame
+                        pending_audio_header = message
+                    continue
                 
                 # Process message based on type
-                await process_websocket_message(message_data, user_id)
+                await process_websocket_message(message, user_id, ts)
                 
-            except json.JSONDecodeError:
-                error_msg = {
-                    "type": "error",
-                    "message": "Invalid JSON format",
-                    "timestamp": datetime.now().isoformat()
-                }
-                await manager.send_personal_message(error_msg, user_id)
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 logger.error(f"Error processing message from {user_id}: {str(e)}")
                 error_msg = {
                     "type": "error", 
                     "message": "Failed to process message",
                     "details": str(e),
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": _NOW_ISO[0]
                 }
                 await manager.send_personal_message(error_msg, user_id)
                 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        manager.disconnect(user_id, conn)
         logger.info(f"User {user_id} disconnected normally")
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {str(e)}")
-        manager.disconnect(user_id)
+        manager.disconnect(user_id, conn)
 
-async def process_websocket_message(message_data: dict, user_id: str):
-    """Process incoming WebSocket messages"""
-    message_type = message_data.get("type")
+async def receive_frame(websocket: WebSocket):
+    """Receive the payload of the next text or binary WebSocket frame"""
+    try:
+        message = await websocket.receive()
+    except RuntimeError:
+        # Socket already closed from our side (force disconnect, shutdown) - end the loop
+        raise WebSocketDisconnect(1006)
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
     
-    if message_type == "text_input":
-        await handle_text_input(message_data, user_id)
-    elif message_type == "audio_input":
-        await handle_audio_input(message_data, user_id)
-    elif message_type == "ping":
-        # Handle ping/keepalive
-        pong_msg = {
-            "type": "pong",
-            "timestamp": datetime.now().isoformat()
-        }
-        await manager.send_personal_message(pong_msg, user_id)
-    else:
-        error_msg = {
-            "type": "error",
-            "message": f"Unknown message type: {message_type}",
-            "timestamp": datetime.now().isoformat()
-        }
-        await manager.send_personal_message(error_msg, user_id)
+    data = message.get("bytes")
+    return data if data is not None else message.get("text", "")
+
+async def process_websocket_message(message: Union[TextInputMsg, PingMsg], user_id: str, ts: str):
+    """Process incoming WebSocket messages - unknown types are already rejected by CLIENT_MESSAGE"""
+    await MESSAGE_HANDLERS[message.type](message, user_id, ts)
+
+async def handle_ping(message: PingMsg, user_id: str, ts: str):
+    """Handle ping/keepalive with the pre-serialized pong"""
+    await manager.send_raw(static_frame(PONG_TMPL, ts), user_id)
 
-async def handle_text_input(message_data: dict, user_id: str):
+async def handle_text_input(message: TextInputMsg, user_id: str, ts: str):
     """Handle text input messages"""
     try:
-        text = message_data.get("text", "").strip()
-        avatar_type = message_data.get("avatar_type", "female")
-        voice = message_data.get("voice", "alloy")
+        text = message.text.strip()
+        avatar_type = message.avatar_type
+        voice = message.voice
         
         if not text:
             error_msg = {
                 "type": "error",
                 "message": "Empty text input",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": ts
             }
             await manager.send_personal_message(error_msg, user_id)
             return
@@ -244,15 +560,11 @@ async def handle_text_input(message_data: dict, user_id: str):
         logger.info(f"Processing text input from {user_id}: {text[:50]}...")
         
         # Send processing status
-        processing_msg = {
-            "type": "processing",
-            "message": "AI is generating response...",
-            "timestamp": datetime.now().isoformat()
-        }
-        await manager.send_personal_message(processing_msg, user_id)
+        await manager.send_raw(static_frame(TEXT_PROCESSING_TMPL, ts), user_id)
         
         # Process through AI pipeline
         result = await avatar_pipeline.process_text_input(text, user_id, avatar_type, voice)
+        done_ts = _NOW_ISO[0]
         
         if result.get("status") == "success":
             response_msg = {
@@ -260,69 +572,66 @@ async def handle_text_input(message_data: dict, user_id: str):
                 "user_input": result["user_input"],
                 "text": result["ai_response_text"],
                 "avatar_video_url": result["avatar_video_url"],
+                "avatar_task_id": result.get("avatar_task_id"),
                 "tokens_used": result.get("tokens_used", 0),
                 "processing_time": result["processing_time"],
-                "timestamp": datetime.now().isoformat()
+                "timestamp": done_ts
             }
         else:
             response_msg = {
                 "type": "error",
                 "message": result.get("error", "Processing failed"),
-                "timestamp": datetime.now().isoformat()
+                "timestamp": done_ts
             }
         
         await manager.send_personal_message(response_msg, user_id)
         
+        # Avatar queued for a stream worker - push the video when it is ready
+        if result.get("avatar_task_id"):
+            schedule_avatar_delivery(result["avatar_task_id"], user_id)
+        
     except Exception as e:
         logger.error(f"Error handling text input for {user_id}: {str(e)}")
         error_msg = {
             "type": "error",
             "message": "Failed to process text input",
             "details": str(e),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _NOW_ISO[0]
         }
         await manager.send_personal_message(error_msg, user_id)
 
-async def handle_audio_input(message_data: dict, user_id: str):
-    """Handle audio input messages"""
+async def handle_audio_input(header: AudioInputMsg, audio_bytes: bytes, user_id: str, ts: str):
+    """Handle audio input: small JSON header plus raw audio bytes"""
     try:
-        audio_data_b64 = message_data.get("audio_data")
-        avatar_type = message_data.get("avatar_type", "female")
-        voice = message_data.get("voice", "alloy")
+        avatar_type = header.avatar_type
+        voice = header.voice
         
-        if not audio_data_b64:
+        if not audio_bytes:
             error_msg = {
                 "type": "error",
                 "message": "No audio data provided",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": ts
             }
             await manager.send_personal_message(error_msg, user_id)
             return
         
-        logger.info(f"Processing audio input from {user_id}")
-        
-        # Send processing status
-        processing_msg = {
-            "type": "processing",
-            "message": "Processing voice input...",
-            "timestamp": datetime.now().isoformat()
-        }
-        await manager.send_personal_message(processing_msg, user_id)
-        
-        # Decode base64 audio
-        try:
-            audio_bytes = base64.b64decode(audio_data_b64)
-        except Exception as e:
+        if len(audio_bytes) > MAX_AUDIO_BYTES:
             error_msg = {
                 "type": "error",
-                "message": "Invalid audio data format",
-                "timestamp": datetime.now().isoformat()
+                "message": f"Audio too large (max {MAX_AUDIO_BYTES} bytes)",
+                "timestamp": ts
             }
             await manager.send_personal_message(error_msg, user_id)
             return
         
+        logger.info(f"Processing audio input from {user_id}")
+        
+        # Send processing status
+        await manager.send_raw(static_frame(AUDIO_PROCESSING_TMPL, ts), user_id)
+        
         # Process through AI pipeline
         result = await avatar_pipeline.process_audio_input(audio_bytes, user_id, avatar_type, voice)
+        done_ts = _NOW_ISO[0]
         
         if result.get("status") == "success":
             response_msg = {
@@ -330,54 +639,156 @@ async def handle_audio_input(message_data: dict, user_id: str):
                 "transcribed_text": result["transcribed_text"],
                 "llm_response": result["ai_response_text"],
                 "avatar_video_url": result["avatar_video_url"],
+                "avatar_task_id": result.get("avatar_task_id"),
                 "tokens_used": result.get("tokens_used", 0),
                 "processing_time": result["processing_time"],
-                "timestamp": datetime.now().isoformat()
+                "timestamp": done_ts
             }
         else:
             response_msg = {
                 "type": "error",
                 "message": result.get("error", "Audio processing failed"),
-                "timestamp": datetime.now().isoformat()
+                "timestamp": done_ts
             }
         
         await manager.send_personal_message(response_msg, user_id)
         
+        # Avatar queued for a stream worker - push the video when it is ready
+        if result.get("avatar_task_id"):
+            schedule_avatar_delivery(result["avatar_task_id"], user_id)
+        
     except Exception as e:
         logger.error(f"Error handling audio input for {user_id}: {str(e)}")
         error_msg = {
             "type": "error",
             "message": "Failed to process audio input",
             "details": str(e),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _NOW_ISO[0]
         }
         await manager.send_personal_message(error_msg, user_id)
 
+# Handlers by message type (audio_input is paired with its binary frame in websocket_endpoint)
+MESSAGE_HANDLERS = {
+    "text_input": handle_text_input,
+    "ping": handle_ping
+}
+
+# Strong references to background delivery tasks
+background_tasks = set()
+
+def schedule_avatar_delivery(task_id: str, user_id: str):
+    """Deliver a queued avatar video to the user once a worker finishes it"""
+    task = asyncio.create_task(deliver_queued_avatar(task_id, user_id))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def deliver_queued_avatar(task_id: str, user_id: str):
+    """Wait for a queued avatar task result and send it over the user's WebSocket"""
+    try:
+        result = await avatar_pipeline.queue_service.get_task_result(task_id, timeout=120)
+        
+        if result.get("status") == "failed":
+            message = {
+                "type": "error",
+                "message": result.get("error", "Avatar generation failed"),
+                "timestamp": _NOW_ISO[0]
+            }
+        else:
+            message = {
+                "type": "avatar_ready",
+                "task_id": task_id,
+                "avatar_video_url": result["video_url"],
+                "timestamp": _NOW_ISO[0]
+            }
+    except Exception as e:
+        logger.error(f"Error delivering avatar task {task_id} to {user_id}: {str(e)}")
+        message = {
+            "type": "error",
+            "message": "Avatar generation timed out",
+            "timestamp": _NOW_ISO[0]
+        }
+    
+    await manager.send_personal_message(message, user_id)
+
 # Additional API endpoints for management and testing
 
 @app.post("/api/test-text")
-async def test_text_processing(request: dict):
+async def test_text_processing(request: TextRequest):
     """Test endpoint for text processing"""
     try:
-        text = request.get("text", "Hello, how are you?")
-        user_id = request.get("user_id", "test_user")
-        avatar_type = request.get("avatar_type", "female")
-        voice = request.get("voice", "alloy")
-        
-        result = await avatar_pipeline.process_text_input(text, user_id, avatar_type, voice)
+        result = await avatar_pipeline.process_text_input(request.text, request.user_id, request.avatar_type, request.voice)
         return result
     except Exception as e:
         logger.error(f"Test endpoint error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/tasks/{task_id}")
+async def get_task_status(task_id: str):
+    """Poll a queued avatar task (avatar_task_id) - the result is included once a worker finishes it"""
+    try:
+        task = await avatar_pipeline.queue_service.get_task_status(task_id)
+    except Exception as e:
+        logger.error(f"Task status error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+@app.post("/api/stream-text")
+async def stream_text_processing(request: TextRequest):
+    """Stream the AI text response sentence by sentence as Server-Sent Events"""
+    text = request.text
+    user_id = request.user_id
+
+    async def event_stream():
+        try:
+            async for sentence in avatar_pipeline.llm.stream_response(text, user_id):
+                yield b"data: " + orjson.dumps({"type": "sentence", "text": sentence}) + b"\n\n"
+            yield b"data: " + orjson.dumps({"type": "done", "timestamp": _NOW_ISO[0]}) + b"\n\n"
+        except Exception as e:
+            logger.error(f"Stream endpoint error: {e}")
+            yield b"data: " + orjson.dumps({"type": "error", "message": str(e)}) + b"\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post(DID_WEBHOOK_PATH)
+async def did_webhook(request: Request):
+    """D-ID talk completion webhook - wakes the waiter blocked on this talk"""
+    # The talk's webhook URL carries DID_WEBHOOK_SECRET as ?token=...
+    secret = avatar_pipeline.did.webhook_secret
+    token = request.query_params.get("token", "")
+    if not secret or not hmac.compare_digest(token.encode(), secret.encode()):
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+    
+    try:
+        payload = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    
+    talk_id = payload.get("id") if isinstance(payload, dict) else None
+    if not talk_id:
+        raise HTTPException(status_code=400, detail="Missing talk id")
+
+    try:
+        if not await avatar_pipeline.queue_service.deliver_talk_result(talk_id, payload):
+            raise HTTPException(status_code=404, detail="Unknown or completed talk")
+        return {"status": "received", "talk_id": talk_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"D-ID webhook error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/user/{user_id}/status")
 async def get_user_status(user_id: str):
     """Get specific user connection status"""
-    if user_id in manager.user_metadata:
+    conn = manager.get(user_id)
+    if conn is not None:
         return {
             "user_id": user_id,
             "connected": True,
-            "metadata": manager.user_metadata[user_id]
+            "metadata": conn.metadata()
         }
     else:
         return {
@@ -388,10 +799,11 @@ async def get_user_status(user_id: str):
 @app.delete("/api/user/{user_id}/disconnect")
 async def force_disconnect_user(user_id: str):
     """Force disconnect a specific user"""
-    if user_id in manager.active_connections:
+    conn = manager.get(user_id)
+    if conn is not None:
         try:
-            await manager.active_connections[user_id].close()
-            manager.disconnect(user_id)
+            await conn.ws.close()
+            manager.disconnect(user_id, conn)
             return {"message": f"User {user_id} disconnected"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -406,7 +818,7 @@ async def get_system_info():
         "version": "1.0.0",
         "environment": os.getenv("ENVIRONMENT", "development"),
         "timestamp": datetime.now().isoformat(),
-        "active_connections": len(manager.active_connections),
+        "active_connections": manager.count(),
         "features": {
             "speech_to_text": True,
             "text_to_speech": True,
@@ -420,8 +832,12 @@ async def get_system_info():
 @app.on_event("startup")
 async def startup_event():
     """Application startup tasks"""
+    global clock_task
     logger.info("Avatar AI System starting up...")
     
+    # Keep the cached envelope timestamp fresh
+    clock_task = asyncio.create_task(_tick_now_iso())
+    
     # Verify environment variables
     required_env_vars = ["OPENAI_API_KEY"]
     missing_vars = [var for var in required_env_vars if not os.getenv(var)]
@@ -438,6 +854,14 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"AI services health check failed: {str(e)}")
     
+    # Relay messages between workers (each worker only holds its own connections)
+    try:
+        await avatar_pipeline.cache.connect()
+        if avatar_pipeline.cache.redis_client:
+            await manager.start_relay(avatar_pipeline.cache.redis_client)
+    except Exception as e:
+        logger.warning(f"Cross-worker relay unavailable: {str(e)}")
+    
     logger.info("Avatar AI System started successfully!")
 
 @app.on_event("shutdown")
@@ -446,12 +870,22 @@ async def shutdown_event():
     logger.info("Avatar AI System shutting down...")
     
     # Close all WebSocket connections
-    for user_id in list(manager.active_connections.keys()):
-        try:
-            await manager.active_connections[user_id].close()
-        except Exception:
-            pass
-        manager.disconnect(user_id)
+    closed = await manager.close_all()
+    logger.info(f"Closed {closed} WebSocket connections")
+    
+    if clock_task:
+        clock_task.cancel()
+    
+    try:
+        await manager.stop_relay()
+    except Exception as e:
+        logger.warning(f"Error stopping cross-worker relay: {str(e)}")
+    
+    # Release pooled upstream connections
+    try:
+        await avatar_pipeline.aclose()
+    except Exception as e:
+        logger.warning(f"Error closing AI service clients: {str(e)}")
     
     logger.info("Avatar AI System shutdown complete!")
 
@@ -459,7 +893,7 @@ async def shutdown_event():
 @app.exception_handler(500)
 async def internal_error_handler(request: Request, exc: Exception):
     logger.error(f"Internal server error: {str(exc)}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal server error", 
@@ -470,7 +904,7 @@ async def internal_error_handler(request: Request, exc: Exception):
 
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc: Exception):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=404,
         content={
             "error": "Not found", 
@@ -493,7 +927,7 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
     debug = os.getenv("DEBUG", "False").lower() == "true"
-    workers = int(os.getenv("WORKERS", 1))
+    workers = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", 1)))
     
     logger.info(f"Starting Avatar AI System on {host}:{port}")
     
@@ -504,15 +938,24 @@ if __name__ == "__main__":
             host=host,
             port=port,
             reload=True,
+            loop="uvloop",
+            http="httptools",
+            ws="websockets",
+            ws_max_size=WS_MAX_SIZE,
             log_level="info"
         )
     else:
-        # Production mode
+        # Production mode - workers need an import string, connections are relayed via Redis
         uvicorn.run(
-            app,
+            "main:app",
             host=host,
             port=port,
             workers=workers,
+            backlog=2048,
+            loop="uvloop",
+            http="httptools",
+            ws="websockets",
+            ws_max_size=WS_MAX_SIZE,
             log_level="info",
             access_log=True
         )
@@ -0,0 +1,20 @@
+# src/backend/uvicorn_worker.py - gunicorn worker class carrying the app's uvicorn settings
+
+import os
+
+from uvicorn.workers import UvicornWorker
+
+# Mirrors main.MAX_AUDIO_BYTES / main.WS_MAX_SIZE - read from the environment here so the
+# gunicorn arbiter does not import the application just to load its worker class
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", 1_048_576))
+WS_MAX_SIZE = MAX_AUDIO_BYTES + 65536
+
+class AvatarUvicornWorker(UvicornWorker):
+    """UvicornWorker with the same loop, parsers and WebSocket frame cap as uvicorn.run in main.py"""
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "loop": "uvloop",
+        "http": "httptools",
+        "ws": "websockets",
+        "ws_max_size": WS_MAX_SIZE
+    }